@@ -5,6 +5,7 @@ import random
 import sys
 import string
 import os
+import io
 
 def calculate_ean13_checksum(code_12_digits):
     total = 0
@@ -445,7 +446,8 @@ def create_price_label(product_name, price_euros, barcode_number, footer="", hei
     
     return filename, barcode_code
 
-def print_label(filename):
+def print_label(filename, data=None):
+    """Print a label file, or the image bytes in data when filename is '-'"""
     cmd = [
         'brother_ql', '--backend', 'linux_kernel',
         '--model', 'QL-800',
@@ -453,12 +455,16 @@ def print_label(filename):
         'print', '-l', '62', filename
     ]
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    # Only stderr is inspected: discard stdout and keep stderr as bytes,
+    # decoding it only to report an error
+    result = subprocess.run(cmd, input=data, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE)
     
-    if 'Total:' in result.stderr:
+    if b'Total:' in result.stderr:
         return True, "Print successful"
     else:
-        return False, f"Print error: {result.stderr.strip()}"
+        stderr = result.stderr.decode(errors='replace')
+        return False, f"Print error: {stderr.strip()}"
 
 def print_sticker_image(image_path):
     """Print a sticker image directly"""
@@ -483,20 +489,13 @@ def print_sticker_image(image_path):
         # Convert to 1-bit black and white
         img = img.convert('1')
         
-        # Save to temporary file
-        temp_filename = f"/tmp/sticker_{os.getpid()}.png"
-        img.save(temp_filename)
+        # Encode in memory as BMP (a plain copy of the bitmap, no deflate
+        # like PNG) and pipe it to brother_ql on stdin
+        data = io.BytesIO()
+        img.save(data, 'BMP')
         
         # Print using brother_ql
-        success, message = print_label(temp_filename)
-        
-        # Clean up
-        try:
-            os.remove(temp_filename)
-        except:
-            pass
-        
-        return success, message
+        return print_label('-', data=data.getvalue())
     except Exception as e:
         return False, f"Error processing sticker: {str(e)}"
 
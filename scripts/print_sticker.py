@@ -6,92 +6,139 @@ Handles PIL/Pillow compatibility issues with brother_ql.
 
 import sys
 import os
-import subprocess
 from PIL import Image
-import tempfile
+from brother_ql.raster import BrotherQLRaster
+from brother_ql.conversion import convert
+from brother_ql.backends.helpers import send
 
-# Monkey patch for Pillow 10+ compatibility with brother_ql
-if not hasattr(Image, 'ANTIALIAS'):
-    Image.ANTIALIAS = Image.Resampling.LANCZOS
+# Image.Resampling and Image.Dither only exist since Pillow 9.1
+_Resampling = getattr(Image, 'Resampling', Image)
+_Dither = getattr(Image, 'Dither', Image)
+
+RESAMPLING_FILTERS = {
+    'nearest': _Resampling.NEAREST,
+    'box': _Resampling.BOX,
+    'bilinear': _Resampling.BILINEAR,
+    'hamming': _Resampling.HAMMING,
+    'bicubic': _Resampling.BICUBIC,
+    'lanczos': _Resampling.LANCZOS,
+}
+
+# Resampling filter used before the 1-bit conversion. Binarization throws
+# away the fine detail LANCZOS keeps, so the cheaper BICUBIC is the default.
+# Override with STICKER_RESAMPLE=<name> (see RESAMPLING_FILTERS).
+RESAMPLE = RESAMPLING_FILTERS.get(
+    os.environ.get('STICKER_RESAMPLE', 'bicubic').lower(),
+    _Resampling.BICUBIC,
+)
+
+# Images with at least this share of pixels already near black or white
+# (logos, QR codes, text) are thresholded instead of dithered
+FLAT_RATIO = 0.9
+THRESHOLD = 128
+_THRESHOLD_LUT = [0] * (THRESHOLD + 1) + [255] * (255 - THRESHOLD)
+
+def _is_flat(img):
+    """Tell whether a grayscale image is mostly black and white already."""
+    histogram = img.histogram()
+    extremes = sum(histogram[:32]) + sum(histogram[224:])
+    return extremes >= FLAT_RATIO * img.width * img.height
 
 def prepare_image(image_path, width=696):
     """
     Prepare image for Brother QL printer.
     Resize if necessary and convert to proper format.
     Width 696 is the printable width for 62mm labels on QL-800.
+    Returns the prepared PIL image, or None on error.
     """
     try:
         img = Image.open(image_path)
         
-        # Convert RGBA to RGB if necessary
+        # Let libjpeg decode large JPEGs in grayscale at 1/2, 1/4 or 1/8
+        # scale, keeping at least twice the target width for the final
+        # resampling pass (only the width constrains the scale, hence the
+        # height of 1)
+        if img.format == 'JPEG' and img.width > width * 2:
+            img.draft('L', (width * 2, 1))
+        
+        # Work in grayscale: the output is 1-bit, so resizing three RGB
+        # bands would only triple the memory traffic
         if img.mode == 'RGBA':
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3])
+            background = Image.new('L', img.size, 255)
+            background.paste(img.convert('L'), mask=img.getchannel('A'))
             img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
+        elif img.mode != 'L':
+            img = img.convert('L')
         
-        # Calculate new dimensions if image is too wide
+        # Bring the image to exactly the printable width, keeping the aspect
+        # ratio. brother_ql would otherwise resize it itself with
+        # Image.ANTIALIAS, which no longer exists in Pillow 10+.
         if img.width > width:
-            ratio = width / img.width
-            new_height = int(img.height * ratio)
-            # Use Resampling.LANCZOS for compatibility with all Pillow versions
-            try:
-                img = img.resize((width, new_height), Image.Resampling.LANCZOS)
-            except AttributeError:
-                # Fallback for older Pillow versions
-                img = img.resize((width, new_height), Image.LANCZOS)
+            # Box-reduce by the integer factor first (close to a memcpy), so
+            # the resampling filter only bridges the remaining gap of less
+            # than 2x
+            factor = img.width // width
+            if factor >= 2:
+                img = img.reduce(factor)
+        if img.width != width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), RESAMPLE)
         
-        # Convert to 1-bit black and white for better printing
-        img = img.convert('1')
+        # Convert to 1-bit black and white for better printing. Plain
+        # thresholding is much cheaper than error diffusion and just as good
+        # on flat graphics; photos keep the Floyd-Steinberg dither.
+        if _is_flat(img):
+            img = img.point(_THRESHOLD_LUT, mode='1')
+        else:
+            img = img.convert('1', dither=_Dither.FLOYDSTEINBERG)
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-            img.save(tmp.name, 'PNG')
-            return tmp.name
+        return img
     except Exception as e:
         print(f"Error preparing image: {e}", file=sys.stderr)
         return None
 
 def print_with_brother_ql(image_path, device='/dev/usb/brother_ql800'):
     """
-    Print image using brother_ql command.
+    Print image using the brother_ql Python API.
+    The prepared image is rasterized in memory, no temporary file is written.
     """
     # First, prepare the image
-    prepared_image = prepare_image(image_path)
-    if not prepared_image:
+    img = prepare_image(image_path)
+    if img is None:
         return False
     
     try:
-        # Try to print with brother_ql
-        cmd = [
-            'brother_ql',
-            '--backend', 'linux_kernel',
-            '--model', 'QL-800',
-            '--printer', device,
-            'print', '-l', '62',
-            prepared_image
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        qlr = BrotherQLRaster('QL-800')
+        instructions = convert(
+            qlr=qlr,
+            images=[img],
+            label='62',
+            rotate='auto',
+            threshold=70.0,
+            dither=False,
+            compress=False,
+            red=False,
+            dpi_600=False,
+            hq=True,
+            cut=True,
+        )
         
-        # Clean up temporary file
-        if prepared_image != image_path:
-            os.unlink(prepared_image)
+        status = send(
+            instructions=instructions,
+            printer_identifier=device,
+            backend_identifier='linux_kernel',
+        )
         
         # Check for success
-        if result.returncode == 0 or 'Total:' in result.stdout:
+        if status.get('outcome') != 'error':
             print("Sticker printed successfully")
             return True
         else:
-            print(f"Print error: {result.stderr}", file=sys.stderr)
+            print(f"Print error: {status}", file=sys.stderr)
             return False
             
     except Exception as e:
-        print(f"Error executing brother_ql: {e}", file=sys.stderr)
-        # Clean up temporary file
-        if prepared_image != image_path and os.path.exists(prepared_image):
-            os.unlink(prepared_image)
+        print(f"Error printing with brother_ql: {e}", file=sys.stderr)
         return False
 
 if __name__ == '__main__':
@@ -33,10 +33,12 @@ PATH="$bin_dir:$PATH" \
   "$tmp_dir/print-agent" label "Livre" 12.90 9781234567890 --footer "Chapitre Neuf" || true
 printf "Check %s for generated label PNG if mock failed.\n" "$root_dir"
 
-printf "Testing sticker image (mock brother_ql)...\n"
-PATH="$bin_dir:$PATH" \
-  STICKER_SCRIPT_PATH="$root_dir/scripts/print_sticker.py" \
-  "$tmp_dir/print-agent" sticker-image "$root_dir/scripts/sticker.png" || true
+printf "Testing sticker image (file device)...\n"
+sticker_out="$tmp_dir/sticker.bin"
+: > "$sticker_out"
+STICKER_SCRIPT_PATH="$root_dir/scripts/print_sticker.py" \
+  "$tmp_dir/print-agent" sticker-image --device "$sticker_out" "$root_dir/scripts/sticker.png"
+printf "Sticker raster bytes written to %s\n" "$sticker_out"
 
 printf "Mock log: %s\n" "${MOCK_BROTHER_QL_LOG:-/tmp/brother_ql_mock.log}"
 printf "Done.\n"
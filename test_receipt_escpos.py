@@ -10,9 +10,14 @@ Usage:
     python3 test_receipt_escpos.py
 """
 
-from escpos.printer import Usb, File
+from escpos.printer import Usb, File, Dummy
+from barcode import Code128
+from barcode.writer import ImageWriter
 from datetime import datetime
+import atexit
+import functools
 import sys
+import time
 
 # Configuration de l'imprimante
 # Pour Epson TM-T20III, les IDs USB sont généralement:
@@ -22,57 +27,130 @@ PRODUCT_ID = 0x0e28  # TM-T20III (peut varier, vérifier avec lsusb)
 # Alternative : utiliser un fichier device
 DEVICE_PATH = "/dev/usb/epson_tmt20iii"
 
+# Commandes ESC/POS utilisées pour construire le ticket
+ESC_INIT = b"\x1b@"
+CODEPAGE_CP437 = b"\x1bt\x00"  # ESC t 0, table utilisée par ENCODING
+ALIGN_LEFT = b"\x1ba\x00"
+ALIGN_CENTER = b"\x1ba\x01"
+ALIGN_RIGHT = b"\x1ba\x02"
+BOLD_ON = b"\x1bE\x01"
+BOLD_OFF = b"\x1bE\x00"
+FEED_6 = b"\x1bd\x06"  # avance avant la coupe, comme printer.cut()
+CUT = b"\x1dV\x00"
+
+ENCODING = "cp437"
+
+# Code-barre rendu en image (203 dpi = 8 points/mm), mêmes dimensions que
+# printer.barcode(height=100, width=3)
+BARCODE_OPTIONS = {
+    "dpi": 203,
+    "module_width": 0.375,  # 3 points par module
+    "module_height": 12.5,  # 100 points
+}
+
+
+# Modes de connexion, essayés dans cet ordre
+TRANSPORTS = [
+    ("usb", lambda: Usb(VENDOR_ID, PRODUCT_ID)),
+    ("file", lambda: File(DEVICE_PATH)),
+]
+
+# Dernier mode réellement ouvert, essayé en premier pendant
+# PRINTER_CACHE_TTL secondes
+PRINTER_CACHE_TTL = 60.0
+_PRINTER_CACHE = {"kind": None, "ts": 0.0}
+
+
+@functools.lru_cache(maxsize=None)
+def get_printer():
+    """Ouvre l'imprimante une seule fois et la garde ouverte entre les tickets.
+
+    Essaie chaque mode de TRANSPORTS une seule fois, en commençant par le
+    dernier qui a fonctionné. Lève l'exception du dernier essai si aucune
+    connexion n'aboutit (rien n'est alors mis en cache).
+    """
+    transports = TRANSPORTS
+    known = _PRINTER_CACHE["kind"]
+    if known and time.monotonic() - _PRINTER_CACHE["ts"] < PRINTER_CACHE_TTL:
+        transports = sorted(TRANSPORTS, key=lambda t: t[0] != known)
+
+    error = None
+    for kind, factory in transports:
+        print(f"Tentative de connexion via {kind}...")
+        try:
+            printer = factory()
+            # python-escpos 3 n'ouvre le device qu'au premier envoi : open()
+            # force la connexion ici pour que l'échec déclenche bien le repli
+            printer.open()
+        except Exception as e:
+            print(f"Échec connexion {kind}: {e}")
+            error = e
+            continue
+        print(f"✓ Connecté via {kind}")
+        _PRINTER_CACHE.update(kind=kind, ts=time.monotonic())
+        return printer
+    raise error
+
+
+@atexit.register
+def close_printer():
+    """Ferme la connexion ouverte par get_printer(), s'il y en a une."""
+    if get_printer.cache_info().currsize:
+        try:
+            get_printer().close()
+        finally:
+            get_printer.cache_clear()
+
 
 def print_test_receipt():
     """Imprime un ticket de test similaire au code Go."""
 
-    # Essayer d'abord avec USB direct, sinon avec device file
+    # Connexion réutilisée si un ticket a déjà été imprimé
     try:
-        print("Tentative de connexion via USB...")
-        printer = Usb(VENDOR_ID, PRODUCT_ID)
-        print("✓ Connecté via USB")
+        printer = get_printer()
     except Exception as e:
-        print(f"Échec connexion USB: {e}")
-        print(f"Tentative via device file {DEVICE_PATH}...")
-        try:
-            printer = File(DEVICE_PATH)
-            print("✓ Connecté via device file")
-        except Exception as e2:
-            print(f"Échec device file: {e2}")
-            print("\nPour trouver les IDs USB de votre imprimante:")
-            print("  lsusb")
-            print("\nPour utiliser le device file:")
-            print(f"  Vérifier que {DEVICE_PATH} existe")
-            sys.exit(1)
-
-    # Initialiser l'imprimante
-    printer.hw('INIT')
+        print(f"Échec connexion: {e}")
+        print("\nPour trouver les IDs USB de votre imprimante:")
+        print("  lsusb")
+        print("\nPour utiliser le device file:")
+        print(f"  Vérifier que {DEVICE_PATH} existe")
+        sys.exit(1)
+
+    # Tout le ticket est construit en mémoire puis envoyé en une seule
+    # écriture, au lieu d'un aller-retour USB par commande.
+    # Initialiser l'imprimante et sélectionner la table de caractères.
+    buf = bytearray(ESC_INIT + CODEPAGE_CP437)
+
+    def text(line):
+        # Les caractères absents de cp437 (ex: '€') deviennent '?'
+        buf.extend(line.encode(ENCODING, errors="replace"))
 
     # Logo (optionnel - commenter si pas de logo)
     # printer.image("/chemin/vers/logo.png", center=True)
     # printer.text("\n")
 
     # En-tête centré
-    printer.set(align='center')
-    printer.text("Magasin de Test\n")
-    printer.text("123 Rue Example\n")
-    printer.text("75001 Paris\n")
-    printer.text("Tel: 01 23 45 67 89\n")
-    printer.text("TVA: FR12345678901\n")
-    printer.text("\n")
+    buf += ALIGN_CENTER
+    text("Magasin de Test\n")
+    text("123 Rue Example\n")
+    text("75001 Paris\n")
+    text("Tel: 01 23 45 67 89\n")
+    text("TVA: FR12345678901\n")
+    text("\n")
 
     # Informations ticket (aligné à gauche)
-    printer.set(align='left')
+    buf += ALIGN_LEFT
     now = datetime.now()
-    printer.text(f"Date: {now.strftime('%d/%m/%Y %H:%M')}\n")
-    printer.text(f"Ticket: TKT{now.strftime('%Y%m%d%H%M%S')}\n")
-    printer.text("\n")
+    barcode_data = f"TKT{now.strftime('%Y%m%d%H%M%S')}"
+    text(f"Date: {now.strftime('%d/%m/%Y %H:%M')}\n")
+    text(f"Ticket: {barcode_data}\n")
+    text("\n")
 
     # En-tête tableau (bold)
-    printer.set(bold=True)
-    printer.text("ARTICLE              QTE  PRIX\n")
-    printer.set(bold=False)
-    printer.text("--------------------------------\n")
+    buf += BOLD_ON
+    text("ARTICLE              QTE  PRIX\n")
+    buf += BOLD_OFF
+    text("--------------------------------\n")
 
     # Articles
     articles = [
@@ -82,38 +160,47 @@ def print_test_receipt():
         ("Eau Minerale 1L", 4, "0.75"),
     ]
 
-    for name, qty, price in articles:
-        # Formater la ligne (nom tronqué à 20 chars)
-        name_padded = name[:20].ljust(20)
-        qty_str = f"{qty:3d}"
-        price_str = f"{price:>6s}"
-        printer.text(f"{name_padded} {qty_str} {price_str}\n")
+    # Formater toutes les lignes d'un coup (nom tronqué à 20 chars)
+    text("".join(f"{name:<20.20} {qty:>3d} {price:>6s}\n"
+                 for name, qty, price in articles))
 
-    printer.text("--------------------------------\n")
+    text("--------------------------------\n")
 
     # Total (centré, bold)
-    printer.set(align='right', bold=True)
-    printer.text("TOTAL:      17.45 EUR\n")
-    printer.set(bold=False)
-    printer.text("\n")
+    buf += ALIGN_RIGHT + BOLD_ON
+    text("TOTAL:      17.45 EUR\n")
+    buf += BOLD_OFF
+    text("\n")
 
     # Paiement (centré)
-    printer.set(align='center')
-    printer.text("PAIEMENT: Especes\n\n")
-    printer.text("Merci de votre visite!\n")
-    printer.text("@votre_instagram\n")
-    printer.text("www.votre-site.com\n\n")
-
-    # Code-barre
-    barcode_data = f"TKT{now.strftime('%Y%m%d%H%M%S')}"
+    buf += ALIGN_CENTER
+    text("PAIEMENT: Especes\n\n")
+    text("Merci de votre visite!\n")
+    text("@votre_instagram\n")
+    text("www.votre-site.com\n\n")
+
+    # Code-barre rendu en image et envoyé en raster (GS v 0), indépendant
+    # du support CODE128 du firmware. Les commandes sont générées sur une
+    # imprimante factice puis ajoutées au ticket.
     try:
-        printer.barcode(barcode_data, 'CODE128', height=100, width=3, pos='BELOW')
+        image = Code128(barcode_data, writer=ImageWriter()).render(BARCODE_OPTIONS)
+        raster = Dummy()
+        raster.image(image, impl='bitImageRaster')
+        buf += raster.output
     except Exception as e:
         print(f"Avertissement: Échec impression code-barre: {e}")
 
     # Saut de lignes et coupe
-    printer.text("\n\n\n")
-    printer.cut()
+    text("\n\n\n")
+    buf += FEED_6 + CUT
+
+    try:
+        printer._raw(bytes(buf))
+    except Exception:
+        # Connexion morte (imprimante éteinte, débranchée...) : l'oublier
+        # pour que le prochain ticket se reconnecte
+        close_printer()
+        raise
 
     print("\n✓ Ticket imprimé avec succès!")
     print("\nVérifiez si des lignes sont doublées sur le ticket imprimé.")